@@ -0,0 +1,292 @@
+#!python
+"""Benchmark the weeding pipeline end to end without network access or real data.
+
+Synthetic WMS exports are generated in a temporary directory, a local stand-in
+for the OCLC token and bibs-holdings endpoints is started on localhost, and
+WeedingProcessor runs against both. Throughput, peak memory (of this process
+and of the largest ingest worker process) and the per-stage timings from the
+run report are printed (and optionally saved) as JSON:
+
+    python benchmark.py --rows 100000 --files 4 --latency 0.05 --error-rate 0.01
+    python benchmark.py --rows 10000 --output bench.json --baseline last.json
+    python benchmark.py --rows 100000 --latency 0.05 --batch-size 50
+
+With --baseline the run fails (exit code 1) if it is more than --tolerance
+slower than the saved result, so it can guard against regressions in CI.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+EXPORT_HEADER = ["OCLC Number", "Title", "Author", "Publication Date", "Subject", "Format", "Edition",
+                 "Publisher", "Language", "LC Call Number", "Local Call Number", "Number of Circulations",
+                 "Last Circulated Date", "Location", "Barcode", "Item Status"]
+LC_CLASSES = ["B", "BF", "BX", "D", "DA", "E", "F", "GV", "HD", "HQ", "JK", "KF", "N", "ND", "PN",
+              "PR", "PS", "Q", "QA", "QH", "R", "RC", "T", "TK", "Z"]
+LOCATIONS = ["FDSA Shelves", "FDSA Shelves", "FDSA Shelves", "Reference", "Archives"]
+
+
+def generate_export(path: str, rows: int, seed: int = 0, distinct_ratio: float = 0.8):
+    """Write a tab-delimited WMS-style .xls export with rows synthetic items.
+
+    About distinct_ratio of the rows have their own OCLC number; the rest repeat
+    one, like copies and multi-volume sets do in real exports.
+    """
+    rng = random.Random(seed)
+    max_oclc = max(int(rows * distinct_ratio), 1)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("Circulation Report\n\n")
+        f.write("\t".join(EXPORT_HEADER) + "\n")
+        for i in range(rows):
+            oclc_num = 1000000 + rng.randrange(max_oclc)
+            if rng.random() < 0.5:
+                oclc_field = f'=HYPERLINK("https://worldcat.org/oclc/{oclc_num}","{oclc_num}")'
+            else:
+                oclc_field = str(oclc_num)
+            lc_class = rng.choice(LC_CLASSES)
+            call_number = (f"{lc_class}{rng.randint(1, 9999)}.{rng.choice('ABCDEFGHKLMPRS')}"
+                           f"{rng.randint(1, 999)} {rng.randint(1900, 2020)}")
+            if rng.random() < 0.005:
+                call_number = "Unclassed"
+            pub_date = "uuuu" if rng.random() < 0.03 else str(rng.randint(1900, 2023))
+            if rng.random() < 0.6:
+                last_circ = f"{rng.randint(1, 12)}/{rng.randint(1, 28)}/{rng.randint(1995, 2024)}"
+            else:
+                last_circ = ""
+            f.write("\t".join([
+                oclc_field, f"Synthetic title {i}", f"Author {rng.randrange(5000)}", pub_date,
+                "Synthetic subject", rng.choice(["Book", "Book", "eBook", "DVD"]), "1st ed.",
+                f"Publisher {rng.randrange(300)}", rng.choice(["eng", "eng", "eng", "spa", "fre"]),
+                call_number, call_number, str(rng.randint(0, 30)), last_circ, rng.choice(LOCATIONS),
+                f"3{i:013d}", "Available",
+            ]) + "\n")
+
+
+class MockWorldCat:
+    """Local stand-in for the OCLC token and bibs-holdings endpoints.
+
+    Every holdings request waits latency seconds (+/- jitter) and fails with a
+    503 at error_rate. Both single lookups (oclcNumber=) and batched searches
+    (q=no:1 OR no:2 ...) are answered. The number of holding institutions is
+    derived from the OCLC number, so results are stable between runs.
+    """
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @staticmethod
+    def brief_record(oclc_num: str) -> Dict:
+        count = int(oclc_num) % 9 if oclc_num.isdigit() else 0
+        holdings = [{"institutionName": f"Synthetic Library &amp; Archive {i}"} for i in range(count)]
+        return {"oclcNumber": oclc_num,
+                "institutionHolding": {"totalHoldingCount": count, "briefHoldings": holdings}}
+
+    def handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; without this, delayed ACKs add ~40 ms per request
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status: int, body: Dict, headers: Optional[Dict] = None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.send_json(200, {"access_token": "benchmark-token", "expires_in": 1199})
+
+            def do_GET(self):
+                with mock.lock:
+                    mock.requests += 1
+                    delay = max(mock.latency + mock.rng.uniform(-mock.jitter, mock.jitter), 0)
+                    failed = mock.rng.random() < mock.error_rate
+                time.sleep(delay)
+                if failed:
+                    self.send_json(503, {"title": "Service unavailable"}, {"Retry-After": "0"})
+                    return
+                query = parse_qs(urlsplit(self.path).query)
+                oclc_nums = query.get("oclcNumber", [])
+                for term in query.get("q", [""])[0].split(" OR "):
+                    if term.startswith("no:"):
+                        oclc_nums.append(term[3:])
+                if not oclc_nums:
+                    self.send_json(400, {"title": "oclcNumber or q is required"})
+                    return
+                self.send_json(200, {"numberOfRecords": len(oclc_nums),
+                                     "briefRecords": [mock.brief_record(num) for num in oclc_nums]})
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def peak_memory_mb(children: bool = False) -> Optional[float]:
+    """Peak resident memory of this process, where the platform reports it.
+
+    With children=True, that of the largest finished child process instead,
+    such as the workers that read the input files.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_benchmark(rows: int = 10000, files: int = 1, latency: float = 0.0, jitter: float = 0.0,
+                  error_rate: float = 0.0, cutoff_year: str = "2004", seed: int = 0,
+                  keep: Optional[str] = None, **options) -> Dict:
+    """Run WeedingProcessor against synthetic data and the mock API; return the results.
+
+    Extra keyword arguments are passed to WeedingProcessor (max_workers, use_cache, ...).
+    """
+    from weeding import WeedingProcessor
+
+    work_dir = keep or tempfile.mkdtemp(prefix="weeding-benchmark-")
+    input_dir = os.path.join(work_dir, "input")
+    output_dir = os.path.join(work_dir, "output")
+    os.makedirs(input_dir, exist_ok=True)
+    try:
+        start = time.perf_counter()
+        for i in range(files):
+            generate_export(os.path.join(input_dir, f"export {i + 1}.xls"), rows // files, seed=seed + i)
+        generate_seconds = time.perf_counter() - start
+
+        with MockWorldCat(latency=latency, jitter=jitter, error_rate=error_rate, seed=seed) as mock:
+            processor = WeedingProcessor(
+                cutoff_year, input_dir=input_dir, output_dir=output_dir,
+                cache_file=os.path.join(work_dir, "holdings cache.db"),
+                credentials=("benchmark-id", "benchmark-secret"),
+                auth_endpoint=f"{mock.url}/token",
+                holdings_endpoint=f"{mock.url}/worldcat/search/v2/bibs-holdings", **options)
+            start = time.perf_counter()
+            success = processor.run()
+            seconds = time.perf_counter() - start
+
+        with open(os.path.join(output_dir, "run report.json"), encoding="utf-8") as f:
+            report = json.load(f)
+        return {
+            "success": success,
+            "rows": rows,
+            "files": files,
+            "latency": latency,
+            "error_rate": error_rate,
+            "options": {key: value for key, value in options.items() if not callable(value)},
+            "generate_seconds": round(generate_seconds, 3),
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(rows / seconds, 1) if seconds else None,
+            "peak_memory_mb": peak_memory_mb(),
+            # Input files are read in worker processes unless there is one file or --ingest-workers 1
+            "peak_worker_memory_mb": peak_memory_mb(children=True),
+            "mock_requests": mock.requests,
+            "stages": report["stages"],
+            "counters": report["counters"],
+            "api": report["api"],
+        }
+    finally:
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the weeding pipeline against synthetic "
+                                                 "exports and a local mock of the WorldCat API.")
+    parser.add_argument("--rows", type=int, default=10000, help="total export rows (default: 10000)")
+    parser.add_argument("--files", type=int, default=1, help="number of export files (default: 1)")
+    parser.add_argument("--latency", type=float, default=0.0, help="mock API latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +/- latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--cutoff-year", default="2004")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", dest="max_workers", type=int, help="concurrent holdings lookups")
+    parser.add_argument("--ingest-workers", type=int, help="processes used to read input files")
+    parser.add_argument("--batch-size", type=int, help="OCLC numbers per holdings request")
+    parser.add_argument("--rate-limit", dest="requests_per_second", type=float, default=0,
+                        help="requests per second, 0 for unlimited (default: 0)")
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false", default=None)
+    parser.add_argument("--keep", metavar="DIR", help="generate into DIR and keep it instead of a temp dir")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline (default: 0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    options = {key: value for key, value in vars(args).items()
+               if value is not None and key in ("max_workers", "ingest_workers", "batch_size",
+                                                "requests_per_second", "use_cache")}
+
+    # The pipeline's own messages would drown out the results
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        results = run_benchmark(rows=args.rows, files=args.files, latency=args.latency, jitter=args.jitter,
+                                error_rate=args.error_rate, cutoff_year=args.cutoff_year, seed=args.seed,
+                                keep=args.keep, **options)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if not results["success"]:
+        return 1
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        limit = baseline["seconds"] * (1 + args.tolerance)
+        if results["seconds"] > limit:
+            print(f"Regression: {results['seconds']}s against a baseline of {baseline['seconds']}s", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""Sort keys for Library of Congress call numbers.
+
+A call number such as "QA76.73.P98 L88 2015 v.2" is split into its class
+letters, class number, cutters, dates and anything else, and rebuilt as a
+plain string that sorts in shelf order:
+
+    QA 00076.73 P98 L88 002015 V 000002
+
+Values that don't start with class letters and a class number (blank,
+"Unclassed", bare accession numbers...) sort after everything else.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+LC_CALL_NUMBER = re.compile(r"^\s*([A-Z]{1,3})\s*(\d+)(?:\.(\d+))?(.*)$", re.DOTALL)
+# Cutters ("P98") and other letter runs, or bare numbers (dates, volumes, copies)
+LC_TOKEN = re.compile(r"([A-Z]+)(\d*)|(\d+)")
+MALFORMED_PREFIX = "~"
+
+
+def normalize_call_number(value) -> str:
+    """Return a sort key for one call number."""
+    if not isinstance(value, str):
+        value = "" if pd.isna(value) else str(value)
+    call_number = value.upper()
+    match = LC_CALL_NUMBER.match(call_number)
+    if not match:
+        return MALFORMED_PREFIX + call_number.strip()
+
+    letters, number, decimal, rest = match.groups()
+    parts = [f"{letters:<3}{int(number):05d}" + (f".{decimal}" if decimal else "")]
+    for cutter, cutter_digits, digits in LC_TOKEN.findall(rest):
+        if cutter:
+            # Cutter numbers are decimals (.P85 files before .P9), so they stay unpadded
+            parts.append(cutter + cutter_digits)
+        else:
+            parts.append(digits.zfill(6))
+    return " ".join(parts)
+
+
+def call_number_keys(call_numbers: pd.Series) -> pd.Series:
+    """Sort keys for a column of call numbers, parsing each distinct value once."""
+    codes, distinct = pd.factorize(call_numbers)
+    # Missing values get code -1, which picks up the trailing blank key
+    keys = np.array([normalize_call_number(value) for value in distinct] + [MALFORMED_PREFIX], dtype=object)
+    return pd.Series(keys[codes], index=call_numbers.index, name=call_numbers.name)
@@ -0,0 +1,73 @@
+"""Record type and column schema for candidate titles.
+
+TITLE_FIELDS is the one list of the export columns the pipeline carries for
+each title. The columns read from the exports, the fields of Title, the row
+hash, and the .txt and .xlsx output columns are all derived from it.
+"""
+import re
+from typing import Any, List, NamedTuple
+
+import pandas as pd
+
+# Export column and Title field for each value carried into the output, in output order
+TITLE_FIELDS = [
+    ("OCLC Number", "oclc_number"),
+    ("Title", "title"),
+    ("Author", "author"),
+    ("Publication Date", "publication_date"),
+    ("Subject", "subject"),
+    ("Format", "format"),
+    ("Edition", "edition"),
+    ("Publisher", "publisher"),
+    ("Language", "language"),
+    ("LC Call Number", "lc_call_number"),
+    ("Local Call Number", "local_call_number"),
+    ("Number of Circulations", "circulations"),
+    ("Last Circulated Date", "last_circulated_date"),
+]
+# Columns computed while reading and sorting, and the Title field each is stored in
+DERIVED_FIELDS = [
+    ("Phrase", "phrase"),
+    ("Sort Key", "sort_key"),
+    ("Row Hash", "row_hash"),
+]
+
+# Export values are read as str (categories for Format and Language), or NaN when blank
+Title = NamedTuple("Title", [(field, Any) for _, field in TITLE_FIELDS] + [(field, str) for _, field in DERIVED_FIELDS])
+Title.__doc__ = "One weeding candidate: its export values, section phrase, shelf order key and row hash."
+
+TITLE_COLUMNS = [column for column, _ in TITLE_FIELDS]
+# Location is only used to select candidates, so it isn't kept on Title
+EXPORT_COLUMNS = TITLE_COLUMNS + ["Location"]
+HOLDINGS_COLUMNS = ['Only Lib?', 'Others Holding', 'In RCL?']
+RESULT_COLUMNS = ['OCLCNum'] + HOLDINGS_COLUMNS + TITLE_COLUMNS[1:]
+TEXT_COLUMNS = TITLE_COLUMNS[:1] + HOLDINGS_COLUMNS + TITLE_COLUMNS[1:]
+# Read as text like every other column, but written out as numbers where they look like one
+NUMBER_COLUMNS = ['Publication Date', 'Number of Circulations']
+NUMBER_INDEXES = [TITLE_COLUMNS.index(column) for column in NUMBER_COLUMNS]
+NUMBER = re.compile(r"-?\d+(\.\d+)?")
+COLUMN_WIDTHS = {'OCLCNum': 12, 'Only Lib?': 9, 'Others Holding': 40, 'In RCL?': 8, 'Title': 50,
+                 'Author': 25, 'Publication Date': 10, 'Subject': 30, 'Format': 10, 'Edition': 12,
+                 'Publisher': 25, 'Language': 9, 'LC Call Number': 20, 'Local Call Number': 20,
+                 'Number of Circulations': 12, 'Last Circulated Date': 12}
+
+
+def to_titles(df: pd.DataFrame) -> List[Title]:
+    """Convert candidate rows, with their derived columns, to Title records in row order."""
+    columns = TITLE_COLUMNS + [column for column, _ in DERIVED_FIELDS]
+    return list(map(Title._make, df[columns].itertuples(index=False, name=None)))
+
+
+def to_number(value):
+    """An int or float for a numeric-looking string; other values are returned unchanged."""
+    if isinstance(value, str) and NUMBER.fullmatch(value.strip()):
+        return float(value) if "." in value else int(value)
+    return value
+
+
+def output_values(title: Title) -> tuple:
+    """The title's export values, in TITLE_FIELDS order, with NUMBER_COLUMNS as numbers."""
+    values = list(title[:len(TITLE_FIELDS)])
+    for index in NUMBER_INDEXES:
+        values[index] = to_number(values[index])
+    return tuple(values)
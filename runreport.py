@@ -0,0 +1,88 @@
+"""Timing and counters for one weeding run, written out as a JSON run report.
+
+    report = RunReport()
+    with report.stage("read files") as stage:
+        df = read_files()
+        stage["rows"] = len(df)
+    report.write("output/run report.json")
+"""
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list; 0 for an empty one."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class RunReport:
+    """Collects wall time, row counts and throughput per stage, plus API statistics."""
+    def __init__(self):
+        self.started = datetime.now()
+        self.stages = []
+        self.counters = {}
+        self.api = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, **fields):
+        """Time the body of a with block as one stage; the yielded dict may be updated with counts."""
+        record = {"stage": name, **fields}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            record["seconds"] = round(seconds, 3)
+            if record.get("rows") and seconds > 0:
+                record["rows_per_second"] = round(record["rows"] / seconds, 1)
+            with self.lock:
+                self.stages.append(record)
+
+    def count(self, group: str, **values):
+        """Record counters such as cache hits under a group name."""
+        with self.lock:
+            self.counters.setdefault(group, {}).update(values)
+
+    def add_api_stats(self, stats: Dict[str, Dict]):
+        """Summarize HTTPTransport.stats: request counts and latency percentiles per endpoint."""
+        for endpoint, endpoint_stats in stats.items():
+            latencies = [1000 * latency for latency in endpoint_stats["latencies"]]
+            self.api[endpoint] = {
+                "requests": endpoint_stats["requests"],
+                "retries": endpoint_stats["retries"],
+                "errors": endpoint_stats["errors"],
+                "latency_ms": {
+                    "mean": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+                    "p50": round(percentile(latencies, 50), 1),
+                    "p90": round(percentile(latencies, 90), 1),
+                    "p99": round(percentile(latencies, 99), 1),
+                    "max": round(max(latencies), 1) if latencies else 0.0,
+                },
+            }
+
+    def as_dict(self, **extra) -> Dict:
+        finished = datetime.now()
+        return {
+            **extra,
+            "started": self.started.isoformat(timespec="seconds"),
+            "finished": finished.isoformat(timespec="seconds"),
+            "seconds": round((finished - self.started).total_seconds(), 3),
+            "stages": self.stages,
+            "counters": self.counters,
+            "api": self.api,
+        }
+
+    def write(self, path: str, **extra):
+        """Write the report as JSON; extra keys (e.g. success) go at the top level."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(**extra), f, indent=2)
@@ -0,0 +1,144 @@
+"""Streaming .xlsx output for result sections.
+
+Rows are written to the workbook one at a time instead of being collected into
+a DataFrame first. XlsxWriter is used in constant-memory mode when it is
+installed; otherwise openpyxl's write-only mode, which pandas already pulls in.
+Either way every sheet gets column widths, a frozen header row, and the text
+columns (OCLC numbers) stored as text so Excel doesn't round or reformat them.
+"""
+import math
+import os
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+# Characters Excel doesn't allow in sheet names, and its length limit
+INVALID_SHEET_CHARS = str.maketrans({c: "_" for c in '[]:*?/\\'})
+MAX_SHEET_NAME = 31
+
+
+def clean_value(value):
+    """Blank out missing values, which neither engine writes as an empty cell."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+
+class SectionWriter:
+    """Writes result sections to .xlsx files, or as sheets of a single workbook.
+
+    Use as a context manager; a single workbook is only complete once closed.
+    It is created on the first write, so a writer with nothing to write leaves
+    an existing workbook alone.
+    """
+    def __init__(self, output_dir: str, columns: Sequence[str], widths: Optional[Dict[str, float]] = None,
+                 text_columns: Iterable[str] = (), single_workbook: Optional[str] = None):
+        self.output_dir = output_dir
+        self.columns = list(columns)
+        self.widths = widths or {}
+        self.text_columns = {self.columns.index(column) for column in text_columns}
+        self.single_workbook = single_workbook
+        self.sheet_names = set()
+        self.workbook = None
+
+    @property
+    def workbook_path(self) -> str:
+        return os.path.join(self.output_dir, self.single_workbook)
+
+    def _open(self, path: str):
+        if xlsxwriter:
+            return xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_numbers": False,
+                                             "strings_to_formulas": False, "strings_to_urls": False})
+        return Workbook(write_only=True)
+
+    def _close(self, workbook, path: str):
+        if xlsxwriter:
+            workbook.close()
+        else:
+            workbook.save(path)
+
+    def _sheet_name(self, name: str) -> str:
+        base = name.translate(INVALID_SHEET_CHARS)[:MAX_SHEET_NAME]
+        sheet_name, n = base, 1
+        while sheet_name.lower() in self.sheet_names:
+            n += 1
+            suffix = f" ({n})"
+            sheet_name = base[:MAX_SHEET_NAME - len(suffix)] + suffix
+        self.sheet_names.add(sheet_name.lower())
+        return sheet_name
+
+    def _write_xlsxwriter(self, workbook, sheet_name: str, rows: Iterable[List]):
+        header_format = workbook.add_format({"bold": True})
+        text_format = workbook.add_format({"num_format": "@"})
+        sheet = workbook.add_worksheet(sheet_name)
+        for col, column in enumerate(self.columns):
+            cell_format = text_format if col in self.text_columns else None
+            sheet.set_column(col, col, self.widths.get(column, 12), cell_format)
+        sheet.freeze_panes(1, 0)
+        sheet.write_row(0, 0, self.columns, header_format)
+        for row_num, row in enumerate(rows, start=1):
+            for col, value in enumerate(row):
+                value = clean_value(value)
+                if value is None:
+                    continue
+                if col in self.text_columns:
+                    sheet.write_string(row_num, col, str(value), text_format)
+                else:
+                    sheet.write(row_num, col, value)
+
+    def _write_openpyxl(self, workbook, sheet_name: str, rows: Iterable[List]):
+        sheet = workbook.create_sheet(sheet_name)
+        for col, column in enumerate(self.columns):
+            sheet.column_dimensions[get_column_letter(col + 1)].width = self.widths.get(column, 12)
+        sheet.freeze_panes = "A2"
+        header = []
+        for column in self.columns:
+            cell = WriteOnlyCell(sheet, value=column)
+            cell.font = Font(bold=True)
+            header.append(cell)
+        sheet.append(header)
+        for row in rows:
+            values = [clean_value(value) for value in row]
+            for col in self.text_columns:
+                if values[col] is not None:
+                    cell = WriteOnlyCell(sheet, value=str(values[col]))
+                    cell.number_format = "@"
+                    values[col] = cell
+            sheet.append(values)
+
+    def write(self, name: str, rows: Iterable[List]) -> str:
+        """Write one section and return the path it was written to."""
+        if self.single_workbook:
+            if self.workbook is None:
+                self.workbook = self._open(self.workbook_path)
+            workbook, path, sheet_name = self.workbook, self.workbook_path, self._sheet_name(name)
+        else:
+            path = os.path.join(self.output_dir, f"{name}.xlsx")
+            workbook, sheet_name = self._open(path), "Sheet1"
+        if xlsxwriter:
+            self._write_xlsxwriter(workbook, sheet_name, rows)
+        else:
+            self._write_openpyxl(workbook, sheet_name, rows)
+        if not self.single_workbook:
+            self._close(workbook, path)
+        return path
+
+    def close(self):
+        if self.workbook is not None:
+            self._close(self.workbook, self.workbook_path)
+            self.workbook = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
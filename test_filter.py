@@ -0,0 +1,60 @@
+"""Checks the vectorized candidate filter against the row-by-row loop it replaced."""
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import generate_export
+from weeding import EXPORT_DTYPES, WeedingProcessor
+
+CUTOFF_YEAR = "2004"
+
+
+def reference_candidates(df: pd.DataFrame, cutoff_year: str) -> list:
+    """(index, Phrase) of each candidate, selected with the original iterrows loop."""
+    candidates = []
+    for index, row in df.iterrows():
+        data = row.to_dict()
+        lastcirc = data["Last Circulated Date"]
+        lastcircyear = 0 if "/" not in str(lastcirc) else str(lastcirc).split("/")[2]
+        if (str(data["Publication Date"]) < cutoff_year or str(data["Publication Date"]) == "uuuu") and \
+           str(lastcircyear) < cutoff_year and data["Location"] == "FDSA Shelves":
+            LCphrase = "".join([a if str.isalpha(a) else "" for a in str(data["LC Call Number"])[0:3]]).upper()
+            candidates.append((index, "UU" if str(data["Publication Date"]) == "uuuu" else LCphrase))
+    return candidates
+
+
+def vectorized_candidates(df: pd.DataFrame, cutoff_year: str) -> list:
+    result = WeedingProcessor(cutoff_year).filter_candidates(df)
+    return list(zip(result.index, result["Phrase"]))
+
+
+@pytest.fixture(scope="module")
+def export_path(tmp_path_factory):
+    path = os.path.join(tmp_path_factory.mktemp("export"), "export.xls")
+    generate_export(path, 20000, seed=1)
+    return path
+
+
+@pytest.mark.parametrize("dtype", [None, EXPORT_DTYPES], ids=["inferred", "export-dtypes"])
+def test_generated_export(export_path, dtype):
+    df = pd.read_csv(export_path, sep='\t', skiprows=2, encoding='utf-8', dtype=dtype)
+    expected = reference_candidates(df, CUTOFF_YEAR)
+    assert expected
+    assert vectorized_candidates(df, CUTOFF_YEAR) == expected
+
+
+def test_mixed_values():
+    # Numeric, NaN, blank and unknown dates, in every combination
+    pub_dates = [1999, 2010, 1850.0, np.nan, "uuuu", "", "2003", "2004", "19uu"]
+    last_circ = ["1/2/2001", "12/31/2010", np.nan, "", 5, "2001"]
+    call_numbers = ["QA76.9 .A1", "b1 .C2", "5th", np.nan, "", "PS-3"]
+    locations = ["FDSA Shelves", "Reference"]
+    df = pd.DataFrame(list(itertools.product(pub_dates, last_circ, call_numbers, locations)),
+                      columns=["Publication Date", "Last Circulated Date", "LC Call Number", "Location"],
+                      dtype=object)
+    expected = reference_candidates(df, CUTOFF_YEAR)
+    assert expected
+    assert vectorized_candidates(df, CUTOFF_YEAR) == expected
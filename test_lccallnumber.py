@@ -0,0 +1,44 @@
+"""Shelf order of the LC call number sort keys."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from lccallnumber import MALFORMED_PREFIX, call_number_keys, normalize_call_number
+
+
+def shelf_order(call_numbers):
+    return sorted(call_numbers, key=normalize_call_number)
+
+
+@pytest.mark.parametrize("expected", [
+    # Class letters: shorter classes file before longer ones that extend them
+    ["B12", "BF12", "Q1", "QA1", "QH1"],
+    # Class numbers are integers, then decimals
+    ["QA9", "QA76", "QA76.5", "QA76.73", "QA76.8", "QA100"],
+    # Cutters are decimals: .P85 files before .P9
+    ["QA76.73 .P2", "QA76.73 .P85", "QA76.73 .P9", "QA76.73 .P98 L88"],
+    # Dates and volumes are numbers
+    ["PS3545 .I345 1999", "PS3545 .I345 2015", "PS3545 .I345 2015 v.2", "PS3545 .I345 2015 v.10"],
+])
+def test_shelf_order(expected):
+    assert shelf_order(reversed(expected)) == expected
+
+
+def test_case_and_spacing_ignored():
+    assert normalize_call_number("qa76.73.p98") == normalize_call_number("QA 76.73 .P98")
+
+
+@pytest.mark.parametrize("value", ["", "Unclassed", "12345", "  ", np.nan, None])
+def test_malformed_sorts_last(value):
+    key = normalize_call_number(value)
+    assert key.startswith(MALFORMED_PREFIX)
+    assert key > normalize_call_number("ZA9999.9 .Z99 2099")
+
+
+def test_call_number_keys_missing_values():
+    call_numbers = pd.Series(["QA76", None, "B12", np.nan, "QA76"], index=[10, 11, 12, 13, 14])
+    keys = call_number_keys(call_numbers)
+    assert list(keys.index) == [10, 11, 12, 13, 14]
+    assert keys[10] == keys[14] == normalize_call_number("QA76")
+    assert keys[11] == keys[13] == MALFORMED_PREFIX
+    assert list(call_numbers.iloc[keys.argsort(kind="stable")].index) == [12, 10, 14, 11, 13]
@@ -0,0 +1,1182 @@
+import os
+import threading
+import time
+import random
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+import json
+import html
+import re
+import sqlite3
+import hashlib
+import cProfile
+from datetime import datetime, timedelta
+from base64 import b64encode
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from lccallnumber import call_number_keys
+from records import COLUMN_WIDTHS, EXPORT_COLUMNS, RESULT_COLUMNS, TEXT_COLUMNS, TITLE_COLUMNS, Title, \
+    output_values, to_titles
+from runreport import RunReport
+from sectionwriter import SectionWriter
+
+# Constants
+def load_credentials(path: str = 'credentials.dat') -> Tuple[str, str]:
+    """Load OCLC API credentials from credentials.dat"""
+    try:
+        with open(path, 'r') as f:
+            lines = f.readlines()
+            if len(lines) >= 2:
+                return lines[0].strip(), lines[1].strip()
+            else:
+                raise ValueError(f"{path} must contain CLIENT_ID and CLIENT_SECRET on separate lines")
+    except FileNotFoundError:
+        raise FileNotFoundError(f"{path} not found. Please create it with your CLIENT_ID and CLIENT_SECRET")
+    except Exception as e:
+        raise Exception(f"Error reading credentials: {str(e)}")
+
+try:
+    CLIENT_ID, CLIENT_SECRET = load_credentials()
+except Exception as e:
+    print(f"Error loading credentials: {str(e)}")
+    CLIENT_ID = ""
+    CLIENT_SECRET = ""
+
+
+MAX_ENUMERATE = 3
+MAX_DISTINCT = 5
+MAX_COUNT = 250
+MIN_COUNT = 50
+HELD_IN_STATE = 'US-FL'
+# Further scopes to count holdings in, each as its own column: a state ('US-GA') or a country ('US')
+EXTRA_SCOPES = []
+AUTH_ENDPOINT = "https://oauth.oclc.org/token"
+HOLDINGS_ENDPOINT = "https://americas.discovery.api.oclc.org/worldcat/search/v2/bibs-holdings"
+MAX_WORKERS = 4
+BATCH_SIZE = 1  # OCLC numbers per holdings request; 1 sends one request per number
+INGEST_WORKERS = min(4, os.cpu_count() or 1)
+REQUESTS_PER_SECOND = 10
+CACHE_FILE = "holdings cache.db"
+CACHE_TTL_DAYS = 90
+CACHE_MAX_ENTRIES = 500000
+JOURNAL_FILE = "holdings journal.jsonl"
+SNAPSHOT_FILE = "run snapshot.json"
+REPORT_FILE = "run report.json"
+WORKBOOK_FILE = "weeding candidates.xlsx"
+PROFILE_FILE = "run profile.prof"
+REQUEST_TIMEOUT = (10, 30)  # (connect, read) seconds
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CHUNK_SIZE = 50000
+# Only EXPORT_COLUMNS (see records.py) are loaded; the rest of each WMS export is skipped
+CATEGORY_COLUMNS = ["Location", "Format", "Language"]
+# Values are read as text, so a column's type doesn't depend on which chunk a row lands in
+EXPORT_DTYPES = {**{column: str for column in TITLE_COLUMNS}, **{column: "category" for column in CATEGORY_COLUMNS}}
+
+class HTTPTransport:
+    """Pooled keep-alive HTTP session with retries and per-endpoint statistics.
+
+    Connection errors, timeouts and RETRY_STATUSES responses are retried with
+    exponential backoff and full jitter; a Retry-After header takes precedence.
+    """
+    def __init__(self, pool_size: int = MAX_WORKERS, timeout=REQUEST_TIMEOUT,
+                 max_retries: int = MAX_RETRIES, backoff: float = BACKOFF_BASE):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(pool_size, 1))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def _record(self, endpoint: str, key: str, latency: Optional[float] = None):
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, {"requests": 0, "retries": 0, "errors": 0, "latencies": []})
+            stats[key] += 1
+            if latency is not None:
+                stats["latencies"].append(latency)
+
+    def _delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return min(max(float(retry_after), 0), BACKOFF_MAX)
+            except ValueError:
+                try:
+                    wait = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                    return min(max(wait, 0), BACKOFF_MAX)
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, min(BACKOFF_MAX, self.backoff * 2 ** attempt))
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        endpoint = urlsplit(url).path.rsplit('/', 1)[-1]
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._record(endpoint, "requests", time.monotonic() - start)
+                if attempt == self.max_retries:
+                    self._record(endpoint, "errors")
+                    raise
+                delay = self._delay(attempt)
+            else:
+                self._record(endpoint, "requests", time.monotonic() - start)
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    if response.status_code >= 400:
+                        self._record(endpoint, "errors")
+                    return response
+                delay = self._delay(attempt, response)
+            self._record(endpoint, "retries")
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def summary(self) -> List[str]:
+        """One line of request statistics per endpoint."""
+        lines = []
+        with self.lock:
+            for endpoint, stats in sorted(self.stats.items()):
+                latencies = stats["latencies"]
+                mean_ms = 1000 * sum(latencies) / len(latencies) if latencies else 0
+                lines.append(f"{endpoint}: {stats['requests']} requests, {stats['retries']} retries, "
+                             f"{stats['errors']} errors, {mean_ms:.0f} ms mean latency")
+        return lines
+
+    def close(self):
+        self.session.close()
+
+def is_transient(error: requests.exceptions.RequestException) -> bool:
+    """Whether a failed request is worth retrying later in the run."""
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code in RETRY_STATUSES
+
+class OCLCAuth:
+    """Client-credentials token shared by all lookup workers.
+
+    A failed token request is remembered and raised again for every later
+    caller, so a run with bad credentials stops after one request.
+    """
+    def __init__(self, transport: Optional[HTTPTransport] = None,
+                 credentials: Optional[Tuple[str, str]] = None, auth_endpoint: str = AUTH_ENDPOINT):
+        self.transport = transport or HTTPTransport(pool_size=1)
+        self.client_id, self.secret = credentials or (CLIENT_ID, CLIENT_SECRET)
+        self.token = None
+        self.token_expiry = None
+        self.auth_endpoint = auth_endpoint
+        self.error = None
+        self.lock = threading.Lock()
+
+    def get_token(self):
+        if self.token and datetime.now() < self.token_expiry:
+            return self.token
+
+        # Only one worker refreshes the token; the others wait and reuse it
+        with self.lock:
+            if self.error:
+                raise self.error
+            if self.token and datetime.now() < self.token_expiry:
+                return self.token
+            try:
+                return self._refresh_token()
+            except Exception as e:
+                # The transport has already retried; asking again won't help
+                self.error = e
+                raise
+
+    def _refresh_token(self):
+        credentials = f"{self.client_id}:{self.secret}"
+        encoded_credentials = b64encode(credentials.encode('utf-8')).decode('utf-8')
+
+        headers = {
+            'Authorization': f'Basic {encoded_credentials}',
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+
+        data = {
+            'grant_type': 'client_credentials',
+            'scope': 'wcapi:view_institution_holdings'
+        }
+
+        response = self.transport.post(self.auth_endpoint, headers=headers, data=data)
+        if response.status_code == 200:
+            token_data = response.json()
+            token = token_data['access_token']
+            expiry = datetime.now() + timedelta(seconds=token_data['expires_in'] - 60)
+            # get_token reads both without the lock, so the expiry is in place before the token
+            self.token_expiry = expiry
+            self.token = token
+            return token
+        else:
+            raise Exception(f"Authentication failed: {response.text}")
+
+class RateLimiter:
+    """Token bucket shared by all lookup workers to stay within API quotas"""
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        if not self.rate or self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class HoldingsCache:
+    """On-disk SQLite cache of holdings responses: each record's totalHoldingCount and briefHoldings.
+
+    Entries are keyed by OCLC number and the query parameters they were fetched
+    with. With refresh="stale" entries older than the TTL are fetched again;
+    with refresh="all" every lookup goes to the network and overwrites the cache.
+    """
+    def __init__(self, path: str, ttl_days: float = CACHE_TTL_DAYS,
+                 max_entries: int = CACHE_MAX_ENTRIES, refresh: str = "stale"):
+        if refresh not in ("stale", "all"):
+            raise ValueError(f"Unknown cache refresh mode: {refresh}")
+        self.ttl = timedelta(days=ttl_days).total_seconds()
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS holdings (
+                                 oclc_number TEXT NOT NULL,
+                                 query TEXT NOT NULL,
+                                 holdings TEXT NOT NULL,
+                                 fetched_at REAL NOT NULL,
+                                 PRIMARY KEY (oclc_number, query))""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS holdings_fetched_at ON holdings (fetched_at)")
+        self.conn.commit()
+
+    @staticmethod
+    def query_key(params: Dict) -> str:
+        return json.dumps({k: params[k] for k in ('heldInState', 'heldInCountry', 'limit') if k in params},
+                          sort_keys=True)
+
+    def get(self, oclc_num, params: Dict) -> Optional[Tuple[Dict, float]]:
+        """Return cached holdings and when they were fetched, or None if missing, stale or refreshing."""
+        if self.refresh == "all":
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT holdings, fetched_at FROM holdings WHERE oclc_number = ? AND query = ?",
+                (str(oclc_num), self.query_key(params))).fetchone()
+            holdings = json.loads(row[0]) if row is not None else None
+            # Entries from older versions are bare briefHoldings lists without the total count
+            if not isinstance(holdings, dict) or time.time() - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return holdings, row[1]
+
+    def put(self, oclc_num, params: Dict, holdings: Dict):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO holdings (oclc_number, query, holdings, fetched_at) VALUES (?, ?, ?, ?)",
+                (str(oclc_num), self.query_key(params), json.dumps(holdings), time.time()))
+            self.conn.commit()
+
+    def evict(self):
+        """Drop the oldest entries beyond max_entries."""
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM holdings WHERE rowid IN "
+                "(SELECT rowid FROM holdings ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            self.conn.commit()
+
+    def close(self):
+        self.evict()
+        with self.lock:
+            self.conn.close()
+
+class CheckpointJournal:
+    """Append-only journal of completed holdings lookups.
+
+    Each finished lookup is written as one JSON line as soon as it completes, so
+    an interrupted run can be resumed without asking the API again. The first
+    line records the settings the lookups were made with; a journal written
+    with other settings is started over instead of resumed.
+    """
+    def __init__(self, path: str, settings: Dict, resume: bool = False):
+        self.path = path
+        self.settings = settings
+        self.completed = {}
+        # OCLC number -> when the oldest of its journaled holdings was fetched
+        self.fetched = {}
+        self.lock = threading.Lock()
+        if resume and not self._load():
+            resume = False
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if not resume:
+            self.file.write(json.dumps({"settings": settings}) + '\n')
+            self.file.flush()
+
+    def _load(self) -> bool:
+        """Read completed lookups; False if there is no journal or it was written with other settings."""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                header = {}
+            if not isinstance(header, dict) or header.get("settings") != self.settings:
+                print("Journal was written with other settings; looking everything up again")
+                return False
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line may be cut short if the process died mid-write
+                    continue
+                self.completed[entry["oclc"]] = (entry["api"], entry["inst"], *entry.get("scopes", []))
+                # Entries written before fetch times were journaled count as stale
+                self.fetched[entry["oclc"]] = entry.get("fetched", 0)
+        return True
+
+    def get(self, oclc_num) -> Optional[Tuple[str, ...]]:
+        return self.completed.get(str(oclc_num))
+
+    def record(self, oclc_num, api_str: str, institutions: str, *scope_counts: str, fetched: float):
+        entry = json.dumps({"oclc": str(oclc_num), "api": api_str, "inst": institutions, "scopes": scope_counts,
+                            "fetched": fetched})
+        with self.lock:
+            self.completed[str(oclc_num)] = (api_str, institutions, *scope_counts)
+            self.fetched[str(oclc_num)] = fetched
+            self.file.write(entry + '\n')
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class RunSnapshot:
+    """Candidates, holdings results and section digests of the last completed run.
+
+    An incremental run diffs its candidates against the snapshot, reuses the
+    holdings of OCLC numbers looked up within the cache TTL, and leaves section
+    files whose contents would not change alone. The snapshot is only trusted
+    if it was written with the same settings.
+    """
+    # 2: extra scope counts are totals rather than capped at 50
+    VERSION = 2
+
+    def __init__(self, path: str, settings: Dict):
+        self.path = path
+        self.settings = settings
+        # OCLC number -> {"rows": sorted row hashes, "api": ..., "inst": ..., "scopes": [...], "fetched": ...}
+        self.candidates = {}
+        # Section name -> {"digest": ..., "file": ...}
+        self.sections = {}
+
+    def load(self) -> bool:
+        """Read the previous snapshot; False if there is none or it can't be used."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            print("No snapshot of a previous run found; processing everything")
+            return False
+        except (OSError, ValueError) as e:
+            print(f"Could not read run snapshot, processing everything: {str(e)}")
+            return False
+        if data.get("version") != self.VERSION or data.get("settings") != self.settings:
+            print("Settings changed since the previous run; processing everything")
+            return False
+        self.candidates = data["candidates"]
+        self.sections = data["sections"]
+        return True
+
+    def holdings(self, oclc_num, max_age: float) -> Optional[Tuple[str, ...]]:
+        """Stored holdings result, or None if there is none or it was fetched over max_age seconds ago."""
+        entry = self.candidates.get(str(oclc_num))
+        if entry and "api" in entry and time.time() - entry.get("fetched", 0) <= max_age:
+            return (entry["api"], entry["inst"], *entry.get("scopes", []))
+        return None
+
+    def save(self, candidates: Dict[str, Dict], sections: Dict[str, Dict]):
+        """Replace the snapshot on disk; a crash mid-write leaves the old one in place."""
+        data = {"version": self.VERSION, "settings": self.settings,
+                "candidates": candidates, "sections": sections}
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(temp_path, self.path)
+        self.candidates = candidates
+        self.sections = sections
+
+def scope_params(scope: str) -> Dict:
+    """Query parameter limiting holdings to a scope: 'US-GA' is a state, 'US' a whole country."""
+    if re.fullmatch(r'[A-Z]{2}-[A-Z0-9]{1,3}', scope):
+        return {'heldInState': scope}
+    if re.fullmatch(r'[A-Z]{2}', scope):
+        return {'heldInCountry': scope}
+    raise ValueError(f"Unknown holdings scope '{scope}'; use a state like US-GA or a country like US")
+
+def read_export(cutoff_year: str, file_path: str) -> pd.DataFrame:
+    """Read one export in a worker process; see WeedingProcessor.read_export."""
+    return WeedingProcessor(cutoff_year, ingest_workers=1).read_export(file_path)
+
+class WeedingProcessor:
+    """Handles the core weeding logic
+
+    Progress is reported to the optional progress callback as dicts with an
+    "event" key: "stage", "file", "lookup", "section" and finally "complete".
+    """
+    def __init__(self, cutoff_year: str, max_workers: int = MAX_WORKERS,
+                 requests_per_second: float = REQUESTS_PER_SECOND, use_cache: bool = True,
+                 cache_ttl_days: float = CACHE_TTL_DAYS, cache_refresh: str = "stale",
+                 resume: bool = False, ingest_workers: int = INGEST_WORKERS, export_txt: bool = False,
+                 input_dir: str = "input", output_dir: str = "output", held_in_state: str = HELD_IN_STATE,
+                 credentials: Optional[Tuple[str, str]] = None, cache_file: str = CACHE_FILE,
+                 progress: Optional[Callable[[Dict], None]] = None, profile: bool = False,
+                 auth_endpoint: str = AUTH_ENDPOINT, holdings_endpoint: str = HOLDINGS_ENDPOINT,
+                 single_workbook: bool = False, incremental: bool = False, batch_size: int = BATCH_SIZE,
+                 extra_scopes: Optional[List[str]] = None):
+        self.cutoff_year = cutoff_year
+        self.batch_size = max(1, batch_size)
+        self.incremental = incremental
+        self.single_workbook = single_workbook
+        self.auth_endpoint = auth_endpoint
+        self.holdings_endpoint = holdings_endpoint
+        self.profile = profile
+        self.report = RunReport()
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.xlsx_dir = os.path.join(output_dir, "xlsx files")
+        self.held_in_state = held_in_state
+        extra_scopes = EXTRA_SCOPES if extra_scopes is None else extra_scopes
+        # The first scope fills "Only Lib?" and "Others Holding"; every other one gets a count column
+        self.scopes = list(dict.fromkeys([held_in_state, *extra_scopes]))
+        self.result_columns = RESULT_COLUMNS + [f"Held in {scope}" for scope in self.scopes[1:]]
+        self.credentials = credentials
+        self.cache_file = cache_file
+        self.progress = progress
+        self.export_txt = export_txt
+        self.ingest_workers = max(1, ingest_workers)
+        self.max_workers = max(1, max_workers)
+        self.rate_limiter = RateLimiter(requests_per_second, burst=self.max_workers)
+        self.use_cache = use_cache
+        self.cache_ttl_days = cache_ttl_days
+        self.cache_refresh = cache_refresh
+        self.cache = None
+        self.resume = resume
+        self.journal = None
+        self.transport = None
+        self.transient_failures = set()
+        # OCLC number -> fetch time of the oldest cached or journaled holdings its result was built from
+        self.fetched_at = {}
+        self.lookups_done = 0
+        self.lock = threading.Lock()
+
+    def emit(self, event: str, **fields):
+        """Send a structured progress event to the progress callback, if any."""
+        if self.progress:
+            self.progress({"event": event, **fields})
+
+    def clean_hyperlinks(self, values: pd.Series) -> pd.Series:
+        """Clean Excel HYPERLINK formulas to extract just the text value."""
+        is_formula = values.str.startswith('=HYPERLINK(', na=False)
+        text = values[is_formula].str.extract(r'"([^"]+)"[^"]*$', expand=False)
+        return values.mask(is_formula & text.notna(), text)
+
+    def read_export(self, file_path: str) -> pd.DataFrame:
+        """Read one WMS export in chunks, keeping only candidate rows and the columns the pipeline uses."""
+        candidates = []
+        with pd.read_csv(file_path, sep='\t', skiprows=2, encoding='utf-8',
+                         usecols=lambda column: column in EXPORT_COLUMNS,
+                         dtype=EXPORT_DTYPES, chunksize=CHUNK_SIZE) as reader:
+            for chunk in reader:
+                chunk = self.filter_candidates(chunk)
+                if 'OCLC Number' in chunk.columns:
+                    chunk['OCLC Number'] = self.clean_hyperlinks(chunk['OCLC Number'])
+                candidates.append(chunk)
+
+        if not candidates:
+            raise ValueError("file contains no records")
+        return pd.concat(candidates, ignore_index=True)
+
+    def process_initial_files(self, input_dir: str) -> pd.DataFrame:
+        """Process initial Excel files and combine their weeding candidates."""
+        xls_files = sorted(f for f in os.listdir(input_dir) if f.endswith('.xls') and not f.endswith('.xls.zip'))
+        
+        if not xls_files:
+            raise ValueError(f"No .xls files found in {input_dir}")
+        
+        file_paths = [os.path.join(input_dir, filename) for filename in xls_files]
+        workers = min(self.ingest_workers, len(xls_files))
+        dfs = []
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Results are collected in file name order, whichever worker finishes first
+                futures = [executor.submit(read_export, self.cutoff_year, file_path) for file_path in file_paths]
+                for filename, future in zip(xls_files, futures):
+                    try:
+                        dfs.append(future.result())
+                        print(f"Processed: {filename}")
+                        self.emit("file", name=filename, rows=len(dfs[-1]))
+                    except Exception as e:
+                        print(f"Error processing {filename}: {str(e)}")
+                        self.emit("file", name=filename, error=str(e))
+        else:
+            for filename, file_path in zip(xls_files, file_paths):
+                try:
+                    dfs.append(self.read_export(file_path))
+                    print(f"Processed: {filename}")
+                    self.emit("file", name=filename, rows=len(dfs[-1]))
+                except Exception as e:
+                    print(f"Error processing {filename}: {str(e)}")
+                    self.emit("file", name=filename, error=str(e))
+        
+        if not dfs:
+            raise ValueError("No files were successfully processed")
+        
+        combined_df = pd.concat(dfs, ignore_index=True)
+        # Categories differ from chunk to chunk, so they are unified once at the end
+        for column in CATEGORY_COLUMNS:
+            if column in combined_df.columns:
+                combined_df[column] = combined_df[column].astype('category')
+        return combined_df
+    
+    def filter_candidates(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Select weeding candidates and derive their "Phrase" section.
+
+        Values are compared as strings, exactly as they appear in the export.
+        """
+        pub_date = df["Publication Date"].map(str)
+        last_circ = df["Last Circulated Date"].map(str)
+        # Titles with no last circulated date count as year 0
+        last_circ_year = last_circ.str.split("/").str[2].where(last_circ.str.contains("/", regex=False), "0")
+        unknown_date = pub_date == "uuuu"
+
+        mask = ((pub_date < self.cutoff_year) | unknown_date) & \
+               (last_circ_year < self.cutoff_year) & (df["Location"] == "FDSA Shelves")
+        candidates = df[mask].copy()
+
+        # Letters from the first three characters of the LC call number, e.g. "QA76" -> "QA"
+        lc_phrase = candidates["LC Call Number"].map(str).str[:3].str.replace(r"[\W\d_]", "", regex=True).str.upper()
+        candidates["Phrase"] = lc_phrase.where(~unknown_date[mask], "UU")
+        return candidates
+
+    def sort_by_lcn(self, x: Title) -> str:
+        """Sort function for LC call numbers, using the key computed by add_sort_keys."""
+        return x.sort_key
+
+    def add_sort_keys(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Compute each title's shelf order key once, so later sorts do no parsing."""
+        df["Sort Key"] = call_number_keys(df["Local Call Number"])
+        return df
+
+    def row_hashes(self, df: pd.DataFrame) -> pd.Series:
+        """Hash of the fields each title's output row is built from, as hex strings."""
+        hashes = pd.util.hash_pandas_object(df[TITLE_COLUMNS].astype(str), index=False)
+        return hashes.map('{:016x}'.format)
+
+    def section_digest(self, titles: List[Title]) -> str:
+        """Digest of a section's rows in order; equal digests mean equal input to the section file."""
+        digest = hashlib.sha1()
+        for title in titles:
+            digest.update(title.row_hash.encode('ascii'))
+        return digest.hexdigest()
+
+    def diff_candidates(self, rows_by_oclc: Dict[str, List[str]],
+                        previous: Dict[str, Dict]) -> Dict[str, List[str]]:
+        """Split OCLC numbers into new, removed, changed and unchanged against the previous run."""
+        diff = {"new": [], "removed": [], "changed": [], "unchanged": []}
+        for oclc_num, rows in rows_by_oclc.items():
+            if oclc_num not in previous:
+                diff["new"].append(oclc_num)
+            elif previous[oclc_num]["rows"] != rows:
+                diff["changed"].append(oclc_num)
+            else:
+                diff["unchanged"].append(oclc_num)
+        diff["removed"] = [oclc_num for oclc_num in previous if oclc_num not in rows_by_oclc]
+        return diff
+
+    def changed_sections(self, section_list: List[Tuple[str, List[Title]]], previous: Dict[str, Dict],
+                         lookups: set) -> List[Tuple[str, List[Title]]]:
+        """Sections whose file has to be written: new or changed rows, or titles being looked up."""
+        def changed(name, titles):
+            entry = previous.get(name)
+            return (not entry or entry["digest"] != self.section_digest(titles)
+                    or not os.path.exists(entry["file"])
+                    or any(str(title.oclc_number) in lookups for title in titles))
+
+        changed_list = [(name, titles) for name, titles in section_list if changed(name, titles)]
+        # A single workbook is rewritten in full if any of its sheets changed or went away
+        if self.single_workbook and (changed_list or set(previous) != {name for name, _ in section_list}):
+            return section_list
+        return changed_list
+
+    def scope_limit(self, scope: str) -> int:
+        """Most briefHoldings a lookup needs to see in a scope; extra scopes only use the total count."""
+        return MAX_DISTINCT + 1 if scope == self.scopes[0] else 1
+
+    def holdings_params(self, oclc_num, scope: Optional[str] = None) -> Dict:
+        """Query parameters for a bibs-holdings lookup, in the first scope unless another is given."""
+        scope = scope or self.scopes[0]
+        return {
+            'oclcNumber': oclc_num,
+            'holdingsAllEditions': False,
+            'holdingsAllVariantRecords': False,
+            **scope_params(scope),
+            'limit': self.scope_limit(scope)
+        }
+
+    def batch_params(self, oclc_nums: List[str], scope: str) -> Dict:
+        """Query parameters for a bibs-holdings search covering several OCLC numbers."""
+        return {
+            'q': ' OR '.join(f'no:{oclc_num}' for oclc_num in oclc_nums),
+            'holdingsAllEditions': False,
+            'holdingsAllVariantRecords': False,
+            **scope_params(scope),
+            # For a search, limit is the number of records returned
+            'limit': len(oclc_nums)
+        }
+
+    def institution_holding(self, record: Dict, limit: int) -> Dict:
+        """A record's total holding count and its first limit briefHoldings, as they are cached."""
+        holding = record["institutionHolding"]
+        return {"totalHoldingCount": holding.get("totalHoldingCount", 0),
+                "briefHoldings": holding.get("briefHoldings", [])[:limit]}
+
+    def fetch_holdings(self, params: Dict, token: str) -> Optional[Dict]:
+        """Fetch holdings from the OCLC API, or None if no record was returned."""
+        headers = {
+            'Authorization': f'Bearer {token}',
+            'Accept': 'application/json'
+        }
+
+        self.rate_limiter.acquire()
+        response = self.transport.get(self.holdings_endpoint, headers=headers, params=params)
+        response.raise_for_status()
+        data_response = response.json()
+
+        if 'briefRecords' in data_response:
+            return self.institution_holding(data_response['briefRecords'][0], params['limit'])
+        return None
+
+    def fetch_batch(self, oclc_nums: List[str], scope: str, auth: OCLCAuth) -> Dict[str, Dict]:
+        """Fetch holdings for several OCLC numbers in one request.
+
+        Returns the holdings of each number whose record came back; numbers that
+        are missing (e.g. merged records) or a failed request yield nothing, and
+        those numbers are left to single lookups.
+        """
+        token = auth.get_token()
+        headers = {
+            'Authorization': f'Bearer {token}',
+            'Accept': 'application/json'
+        }
+
+        try:
+            self.rate_limiter.acquire()
+            response = self.transport.get(self.holdings_endpoint, headers=headers, params=self.batch_params(oclc_nums, scope))
+            response.raise_for_status()
+            records = response.json().get('briefRecords', [])
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Batch lookup of {len(oclc_nums)} OCLC numbers failed, looking them up one at a time: {str(e)}")
+            return {}
+
+        # The API drops leading zeros from OCLC numbers
+        wanted = {oclc_num.lstrip('0'): oclc_num for oclc_num in oclc_nums}
+        holdings = {}
+        for record in records:
+            oclc_num = wanted.get(str(record.get('oclcNumber', '')).lstrip('0'))
+            if oclc_num is not None and isinstance(record.get('institutionHolding'), dict):
+                # Trimmed to what a single lookup returns, so both share cache entries
+                holdings[oclc_num] = self.institution_holding(record, self.scope_limit(scope))
+        return holdings
+
+    def summarize_holdings(self, holdings: List[Dict]) -> Tuple[str, str]:
+        """Turn briefHoldings into the "Only Lib?" and "Others Holding" values."""
+        inst_count = len(holdings)
+
+        if inst_count == 1:
+            api_str = "Y"
+            institutions = ""
+        elif inst_count > 1 and inst_count <= MAX_ENUMERATE:
+            inst_names = [html.unescape(h["institutionName"]) for h in holdings[:MAX_ENUMERATE]]
+            if "Stetson University" in inst_names:
+                inst_names.remove("Stetson University")
+            api_str = f"1 of {inst_count}"
+            institutions = '; '.join(inst_names)
+        elif inst_count <= MAX_DISTINCT:
+            api_str = f"1 of {inst_count}"
+            institutions = ""
+        else:
+            api_str = "N"
+            institutions = ""
+        return api_str, institutions
+
+    def count_holdings(self, holdings: Dict) -> str:
+        """Number of holding institutions for a scope's column."""
+        return str(holdings["totalHoldingCount"])
+
+    def lookup_batch(self, oclc_nums: List[str], auth: OCLCAuth) -> Dict[str, Tuple[str, ...]]:
+        """Look up holdings in every scope for a batch of OCLC numbers.
+
+        Each result is ("Only Lib?", "Others Holding", count in each extra scope),
+        with "Error" in place of a scope that couldn't be looked up. Journaled
+        numbers are answered from the journal; see lookup_scope for the rest.
+        """
+        results = {}
+        pending = []
+        for oclc_num in oclc_nums:
+            completed = self.journal.get(oclc_num) if self.journal else None
+            if completed:
+                results[oclc_num] = completed
+                self.note_fetched(oclc_num, self.journal.fetched[str(oclc_num)])
+            else:
+                pending.append(oclc_num)
+        if not pending:
+            return results
+
+        # All scopes of a batch run in the same worker, sharing its connection, the cache and the rate limit
+        scope_holdings = [self.lookup_scope(pending, scope, auth) for scope in self.scopes]
+        for oclc_num in pending:
+            try:
+                holdings = scope_holdings[0][oclc_num]
+                result = self.summarize_holdings(holdings["briefHoldings"]) if holdings is not None else ("Error", "")
+                for extra in scope_holdings[1:]:
+                    holdings = extra[oclc_num]
+                    result += (self.count_holdings(holdings) if holdings is not None else "Error",)
+            except (KeyError, IndexError, TypeError) as e:
+                # Cached or batched holdings in an unexpected shape fail only this number
+                print(f"Unexpected holdings for OCLC #{oclc_num}: {type(e).__name__} {str(e)}")
+                result = ("Error", "") + ("Error",) * (len(self.scopes) - 1)
+            results[oclc_num] = result
+            if self.journal and "Error" not in result:
+                self.journal.record(oclc_num, *result, fetched=self.fetched_at.get(oclc_num, time.time()))
+        return results
+
+    def note_fetched(self, oclc_num, fetched_at: float):
+        """Remember the oldest fetch time of the holdings an OCLC number's result is built from."""
+        with self.lock:
+            self.fetched_at[oclc_num] = min(fetched_at, self.fetched_at.get(oclc_num, fetched_at))
+
+    def lookup_scope(self, oclc_nums: List[str], scope: str, auth: OCLCAuth) -> Dict[str, Optional[Dict]]:
+        """Holdings in one scope for each OCLC number, or None where the lookup failed.
+
+        Cached numbers are answered without a request; the rest go to the API
+        in one batched request, and any the batch didn't answer are looked up
+        one at a time.
+        """
+        results = {}
+        pending = []
+        for oclc_num in oclc_nums:
+            cached = self.cache.get(oclc_num, self.holdings_params(oclc_num, scope)) if self.cache else None
+            if cached is not None:
+                results[oclc_num], fetched_at = cached
+                self.note_fetched(oclc_num, fetched_at)
+            else:
+                pending.append(oclc_num)
+
+        batchable = [oclc_num for oclc_num in pending if oclc_num.isdigit()]
+        fetched = self.fetch_batch(batchable, scope, auth) if len(batchable) > 1 else {}
+        for oclc_num in pending:
+            if oclc_num in fetched:
+                if self.cache:
+                    self.cache.put(oclc_num, self.holdings_params(oclc_num, scope), fetched[oclc_num])
+                results[oclc_num] = fetched[oclc_num]
+            else:
+                results[oclc_num] = self.download_holdings(oclc_num, scope, auth)
+        return results
+
+    def download_holdings(self, oclc_num, scope: str, auth: OCLCAuth) -> Optional[Dict]:
+        """Fetch one OCLC number's holdings in a scope from the API and cache them if enabled."""
+        params = self.holdings_params(oclc_num, scope)
+        token = auth.get_token()
+        try:
+            holdings = self.fetch_holdings(params, token)
+        except requests.exceptions.RequestException as e:
+            print(f"Error processing OCLC #{oclc_num}: {str(e)}")
+            if is_transient(e):
+                with self.lock:
+                    self.transient_failures.add(str(oclc_num))
+            return None
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            # e.g. an empty briefRecords list or a record without institutionHolding
+            print(f"Unexpected response for OCLC #{oclc_num}: {type(e).__name__} {str(e)}")
+            return None
+        if holdings is not None and self.cache:
+            self.cache.put(oclc_num, params, holdings)
+        return holdings
+
+    def start_lookups(self, executor: ThreadPoolExecutor, oclc_nums: List[str],
+                      auth: OCLCAuth) -> Dict[str, Future]:
+        """Queue holdings lookups for the OCLC numbers, in order and batch_size at a time, on the executor.
+
+        Returns a future per OCLC number, resolved when its batch finishes. A
+        lookup that raises (e.g. authentication) fails every unfinished future
+        and cancels the lookups still queued.
+        """
+        total = len(oclc_nums)
+        self.lookups_done = 0
+        futures = {oclc_num: Future() for oclc_num in oclc_nums}
+
+        def lookup(batch):
+            try:
+                results = self.lookup_batch(batch, auth)
+            except Exception as e:
+                for future in futures.values():
+                    try:
+                        future.set_exception(e)
+                    except InvalidStateError:
+                        pass
+                executor.shutdown(wait=False, cancel_futures=True)
+                return
+            for oclc_num in batch:
+                try:
+                    futures[oclc_num].set_result(results[oclc_num])
+                except InvalidStateError:
+                    # Another batch already failed the run
+                    return
+            with self.lock:
+                self.lookups_done += len(batch)
+                done = self.lookups_done
+            self.emit("lookup", done=done, total=total)
+
+        for start in range(0, total, self.batch_size):
+            try:
+                executor.submit(lookup, oclc_nums[start:start + self.batch_size])
+            except RuntimeError:
+                # A lookup failed and shut the executor down
+                break
+        return futures
+
+    def resolve_holdings(self, oclc_nums: List[str], auth: OCLCAuth) -> Dict[str, Tuple[str, ...]]:
+        """Look up holdings for each OCLC number using OCLC API."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = self.start_lookups(executor, oclc_nums, auth)
+            return {oclc_num: future.result() for oclc_num, future in futures.items()}
+
+    def process_holdings(self, input_data: List[Title], holdings: Dict[str, Tuple[str, ...]]) -> List[List]:
+        """Build output rows, in RESULT_COLUMNS order, from resolved holdings information."""
+        processed_data = []
+        for title in input_data:
+            api_str, institutions, *scope_counts = holdings[str(title.oclc_number)]
+            # Empty string for In RCL?
+            processed_data.append([title.oclc_number, api_str, institutions, "",
+                                   *output_values(title)[1:], *scope_counts])
+
+        return processed_data
+
+    def export_section(self, titles: List[Title], output_file: str):
+        """Write a section's candidates to a tab-delimited text file; holdings columns are left empty."""
+        with open(output_file, "w+", encoding="utf-8") as outfile:
+            outfile.write("\t".join(TEXT_COLUMNS) + '\n')
+            for title in titles:
+                values = output_values(title)
+                out = "\t".join([str(values[0]), "", "", ""] + [str(value) for value in values[1:]])
+                outfile.write(out + '\n')
+
+    def section_writer(self) -> SectionWriter:
+        """Streaming xlsx writer for result sections."""
+        return SectionWriter(self.xlsx_dir, self.result_columns, COLUMN_WIDTHS, text_columns=['OCLCNum'],
+                             single_workbook=WORKBOOK_FILE if self.single_workbook else None)
+
+    def write_sections(self, writer: SectionWriter, section_list: List[Tuple[str, List[Title]]],
+                       holdings: Dict[str, Tuple[str, ...]], stage: Dict) -> Dict[str, str]:
+        """Write each section once holdings for all of its titles are known.
+
+        holdings may map OCLC numbers to futures still being looked up; sections
+        are written as soon as their lookups finish, while later ones continue.
+        Returns the file each successfully written section went to.
+        """
+        written = {}
+        for name, titles in section_list:
+            # A failed lookup (e.g. authentication) raises here and stops the run
+            for title in titles:
+                oclc_num = str(title.oclc_number)
+                if isinstance(holdings[oclc_num], Future):
+                    holdings[oclc_num] = holdings[oclc_num].result()
+            try:
+                start = time.perf_counter()
+                processed_data = self.process_holdings(titles, holdings)
+                output_file = writer.write(name, processed_data)
+                stage["write_seconds"] = round(stage.get("write_seconds", 0) + time.perf_counter() - start, 3)
+                stage["files"] = stage.get("files", 0) + 1
+                print(f"Results written to {output_file}" + (f" ({name})" if self.single_workbook else ""))
+                self.emit("section", name=name, rows=len(processed_data), file=output_file)
+                written[name] = output_file
+            except Exception as e:
+                print(f"An error occurred processing {name}: {str(e)}")
+                self.emit("section", name=name, error=str(e))
+                continue
+        return written
+
+    def retry_failed(self, holdings: Dict[str, Tuple[str, ...]], auth: OCLCAuth):
+        """Retry transiently failed lookups, updating holdings in place."""
+        failed = sorted(self.transient_failures)
+        self.transient_failures.clear()
+        print(f"Retrying {len(failed)} lookups that failed transiently...")
+        # The retry pass counts its lookups from zero again
+        self.emit("stage", stage="retry", lookups=len(failed))
+        holdings.update(self.resolve_holdings(failed, auth))
+
+    def close_lookups(self):
+        """Close the transport, cache and journal opened for the holdings step, if still open."""
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+        if self.cache:
+            self.cache.close()
+            self.cache = None
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+    def run(self):
+        """Main processing function; writes a run report and, if enabled, a cProfile dump."""
+        self.report = RunReport()
+        profiler = cProfile.Profile() if self.profile else None
+        if profiler:
+            # Only the main thread is profiled; lookup time shows up as waiting on the pool
+            profiler.enable()
+        try:
+            success = self.run_stages()
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self.output_dir, PROFILE_FILE))
+
+        try:
+            self.report.write(os.path.join(self.output_dir, REPORT_FILE),
+                              success=success, cutoff_year=self.cutoff_year, held_in_state=self.held_in_state,
+                              scopes=self.scopes)
+        except OSError as e:
+            print(f"Could not write run report: {str(e)}")
+        return success
+
+    def run_stages(self) -> bool:
+        """Run the weeding steps, returning whether they completed."""
+        try:
+            # Create directories
+            os.makedirs(self.input_dir, exist_ok=True)
+            os.makedirs(self.output_dir, exist_ok=True)
+            os.makedirs(self.xlsx_dir, exist_ok=True)
+            for scope in self.scopes:
+                scope_params(scope)
+
+            print("Step 1: Processing initial files...")
+            self.emit("stage", stage="ingest")
+            # Titles are filtered and given their section phrase as they are read
+            with self.report.stage("read files") as stage:
+                candidates = self.process_initial_files(self.input_dir)
+                stage["rows"] = len(candidates)
+
+            # Sort and group titles
+            with self.report.stage("sort", rows=len(candidates)):
+                candidates = self.add_sort_keys(candidates).sort_values("Sort Key", kind="stable")
+                candidates["Row Hash"] = self.row_hashes(candidates)
+                titles = to_titles(candidates)
+                # From here on titles carry everything the later stages need
+                del candidates
+                sections = {}
+                for title in titles:
+                    if title.phrase not in sections:
+                        sections[title.phrase] = []
+                    sections[title.phrase].append(title)
+
+            print("\nStep 2: Dividing titles into sections...")
+            self.emit("stage", stage="sections", titles=len(titles))
+            with self.report.stage("sections", rows=len(titles)) as stage:
+                # Separate into main and miscellaneous sections
+                misc_titles = []
+                main_sections = {}
+                for phrase, phrase_titles in sections.items():
+                    if len(phrase_titles) < 20:
+                        misc_titles.extend(phrase_titles)
+                    else:
+                        main_sections[phrase] = phrase_titles
+
+                # (file name, titles) for every section, in the order they are processed
+                section_list = []
+                # Process main sections
+                for section, titles in main_sections.items():
+                    numtitles = len(titles)
+                    numsections = round(numtitles/MAX_COUNT) if numtitles > MAX_COUNT else 1
+                    sectionlen = int(numtitles/numsections) + 1
+                
+                    for i in range(numsections):
+                        sectionnum = (" " + str(i+1)) if numsections > 1 else ""
+                        name = f"{section if section else 'blank'} candidates{sectionnum}"
+                        section_list.append((name, titles[i*sectionlen:(i+1)*sectionlen]))
+
+                # Process miscellaneous section
+                if misc_titles:
+                    misc_titles = sorted(misc_titles, key=self.sort_by_lcn)
+                    section_list.append(("MISC candidates", misc_titles))
+
+                if self.export_txt:
+                    for name, titles in section_list:
+                        self.export_section(titles, os.path.join(self.output_dir, f"{name}.txt"))
+                stage["sections"] = len(section_list)
+            print(f"{len(section_list)} sections to process")
+
+            print("\nStep 3: Processing OCLC holdings...")
+            self.transport = HTTPTransport(pool_size=self.max_workers)
+            auth = OCLCAuth(self.transport, self.credentials, self.auth_endpoint)
+            if self.use_cache:
+                self.cache = HoldingsCache(self.cache_file, ttl_days=self.cache_ttl_days, refresh=self.cache_refresh)
+            self.journal = CheckpointJournal(os.path.join(self.output_dir, JOURNAL_FILE),
+                                             {"held_in_state": self.held_in_state, "scopes": self.scopes},
+                                             resume=self.resume)
+            if self.resume:
+                print(f"Resuming: {len(self.journal.completed)} lookups already completed")
+            # Each distinct OCLC number is looked up once and shared by all of its rows
+            rows_by_oclc = {}
+            for _, titles in section_list:
+                for title in titles:
+                    rows_by_oclc.setdefault(str(title.oclc_number), []).append(title.row_hash)
+            for rows in rows_by_oclc.values():
+                rows.sort()
+            oclc_nums = list(rows_by_oclc)
+            num_titles = sum(len(titles) for _, titles in section_list)
+
+            snapshot = RunSnapshot(os.path.join(self.output_dir, SNAPSHOT_FILE),
+                                   {"held_in_state": self.held_in_state, "columns": self.result_columns,
+                                    "single_workbook": bool(self.single_workbook)})
+            holdings = {}
+            previous_sections = {}
+            if self.incremental and snapshot.load():
+                with self.report.stage("diff", rows=num_titles) as stage:
+                    diff = self.diff_candidates(rows_by_oclc, snapshot.candidates)
+                    stage.update({key: len(nums) for key, nums in diff.items()})
+                    print(f"Changes since the previous run: {len(diff['new'])} new, {len(diff['changed'])} changed, "
+                          f"{len(diff['removed'])} removed, {len(diff['unchanged'])} unchanged OCLC numbers")
+                    self.report.count("incremental", **{key: len(nums) for key, nums in diff.items()})
+                    # Holdings depend only on the OCLC number, so changed rows keep their result too,
+                    # until it is as old as a cache entry may get
+                    if self.cache_refresh != "all":
+                        max_age = timedelta(days=self.cache_ttl_days).total_seconds()
+                        for oclc_num in oclc_nums:
+                            stored = snapshot.holdings(oclc_num, max_age)
+                            if stored:
+                                holdings[oclc_num] = stored
+                    previous_sections = snapshot.sections
+
+            lookup_nums = [oclc_num for oclc_num in oclc_nums if oclc_num not in holdings]
+            looked_up = set(lookup_nums)
+            write_list = self.changed_sections(section_list, previous_sections, looked_up)
+            write_names = {name for name, _ in write_list}
+            # Unchanged sections keep the file the previous run wrote
+            sections_written = {}
+            for name, titles in section_list:
+                if name not in write_names:
+                    sections_written[name] = previous_sections[name]["file"]
+                    self.emit("section", name=name, rows=len(titles), file=sections_written[name], reused=True)
+            if previous_sections:
+                print(f"{len(write_list)} of {len(section_list)} sections changed; reusing the rest")
+                self.report.count("incremental", sections_written=len(write_list),
+                                  sections_reused=len(sections_written))
+                if not self.single_workbook:
+                    current_names = {name for name, _ in section_list}
+                    for name, entry in previous_sections.items():
+                        if name not in current_names and os.path.exists(entry["file"]):
+                            os.remove(entry["file"])
+                            print(f"Removed {entry['file']} (section no longer has candidates)")
+
+            print(f"Looking up {len(lookup_nums)} distinct OCLC numbers for {num_titles} titles "
+                  f"({num_titles - len(lookup_nums)} calls saved)")
+            self.emit("stage", stage="holdings", titles=num_titles, lookups=len(lookup_nums))
+            lookup_time = time.time()
+            self.fetched_at = {}
+            # Sections are written in order while lookups for later sections are still running
+            with self.report.stage("holdings lookups and xlsx writes", rows=num_titles) as stage:
+                stage["lookups"] = len(lookup_nums)
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    holdings.update(self.start_lookups(executor, lookup_nums, auth))
+                    with self.section_writer() as writer:
+                        sections_written.update(self.write_sections(writer, write_list, holdings, stage))
+                # Lookups for sections that failed to write are still futures
+                holdings = {oclc_num: result.result() if isinstance(result, Future) else result
+                            for oclc_num, result in holdings.items()}
+
+            if self.transient_failures:
+                with self.report.stage("retry failed lookups", rows=len(self.transient_failures)) as stage:
+                    failed = set(self.transient_failures)
+                    self.retry_failed(holdings, auth)
+                    # A single workbook can't be patched in place, so it is written again in full
+                    retry_sections = [(name, titles) for name, titles in write_list
+                                      if self.single_workbook or any(str(title.oclc_number) in failed
+                                                                     for title in titles)]
+                    with self.section_writer() as writer:
+                        sections_written.update(self.write_sections(writer, retry_sections, holdings, stage))
+            self.report.count("lookups", titles=num_titles, distinct=len(lookup_nums),
+                              calls_saved=num_titles - len(lookup_nums),
+                              errors=sum(1 for result in holdings.values() if "Error" in result))
+
+            # Failed lookups are left out so the next incremental run tries them again
+            snapshot_candidates = {}
+            for oclc_num, rows in rows_by_oclc.items():
+                api_str, institutions, *scope_counts = holdings[oclc_num]
+                entry = {"rows": rows}
+                if "Error" not in holdings[oclc_num]:
+                    # Reused results keep the time they were first fetched, and results built from
+                    # cached holdings the time of the oldest cache entry; only fresh fetches count from now
+                    if oclc_num in looked_up:
+                        fetched = self.fetched_at.get(oclc_num, lookup_time)
+                    else:
+                        fetched = snapshot.candidates[oclc_num]["fetched"]
+                    entry.update(api=api_str, inst=institutions, scopes=scope_counts, fetched=fetched)
+                snapshot_candidates[oclc_num] = entry
+            try:
+                snapshot.save(snapshot_candidates,
+                              {name: {"digest": self.section_digest(titles), "file": sections_written[name]}
+                               for name, titles in section_list if name in sections_written})
+            except OSError as e:
+                print(f"Could not write run snapshot: {str(e)}")
+
+            for line in self.transport.summary():
+                print(line)
+            self.report.add_api_stats(self.transport.stats)
+            if self.cache:
+                print(f"\nHoldings cache: {self.cache.hits} hits, {self.cache.misses} misses")
+                self.report.count("cache", hits=self.cache.hits, misses=self.cache.misses)
+            self.close_lookups()
+
+            print(f"\nProcess complete! Check the '{self.xlsx_dir}' directory for results.")
+            self.emit("complete", success=True)
+            return True
+
+        except Exception as e:
+            print(f"\nError occurred: {str(e)}")
+            self.emit("complete", success=False, error=str(e))
+            return False
+        finally:
+            # Also on failure, so repeated runs in one process don't leak sessions or file handles
+            self.close_lookups()
@@ -0,0 +1,93 @@
+#!python
+"""Run the weeding process without the GUI, e.g. for scheduled overnight runs:
+
+    python weedingCLI.py 2004 --input "spring/input" --output "spring/output" --json
+
+The same run is available from Python through weeding.WeedingProcessor.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Find weeding candidates in OCLC WMS exports and check "
+                                                 "their holdings with the WorldCat API.")
+    parser.add_argument("cutoff_year", help="titles published and last circulated before this year are candidates")
+    parser.add_argument("--input", dest="input_dir", default="input",
+                        help="directory of WMS .xls exports (default: input)")
+    parser.add_argument("--output", dest="output_dir", default="output",
+                        help="directory for results (default: output)")
+    parser.add_argument("--state", dest="held_in_state",
+                        help="ISO 3166-2 code of the state to check holdings in, e.g. US-FL")
+    parser.add_argument("--scope", dest="extra_scopes", action="append",
+                        help="also count holdings in this state (US-GA) or country (US), as an extra column; "
+                             "may be given more than once")
+    parser.add_argument("--credentials", help="file with the client ID and secret (default: credentials.dat)")
+    parser.add_argument("--workers", dest="max_workers", type=int, help="concurrent holdings lookups")
+    parser.add_argument("--ingest-workers", type=int, help="processes used to read input files")
+    parser.add_argument("--batch-size", type=int,
+                        help="look up this many OCLC numbers per request, falling back to single lookups "
+                             "for any a batch doesn't answer (default: 1)")
+    parser.add_argument("--rate-limit", dest="requests_per_second", type=float,
+                        help="maximum holdings requests per second")
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false", default=None,
+                        help="don't read or write the holdings cache")
+    parser.add_argument("--cache-file", help="holdings cache database (default: holdings cache.db)")
+    parser.add_argument("--refresh-cache", dest="cache_refresh", action="store_const", const="all",
+                        help="look up every title again instead of only stale cache entries")
+    parser.add_argument("--resume", action="store_true", default=None,
+                        help="skip lookups already completed by an interrupted run")
+    parser.add_argument("--incremental", action="store_true", default=None,
+                        help="only look up new titles and rewrite sections that changed since the last run")
+    parser.add_argument("--export-txt", action="store_true", default=None,
+                        help="also write each section as a tab-delimited .txt file")
+    parser.add_argument("--single-workbook", action="store_true", default=None,
+                        help="write all sections as sheets of one workbook instead of one file each")
+    parser.add_argument("--profile", action="store_true", default=None,
+                        help="write a cProfile dump of the run to the output directory")
+    parser.add_argument("--json", action="store_true",
+                        help="write progress events as JSON lines on stdout; messages go to stderr")
+    return parser.parse_args(argv)
+
+
+def json_progress(stream):
+    """Progress callback writing one JSON object per line to stream."""
+    lock = threading.Lock()
+
+    def progress(event):
+        line = json.dumps({"time": round(time.time(), 3), **event})
+        with lock:
+            stream.write(line + "\n")
+            stream.flush()
+    return progress
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    events = sys.stdout
+    if args.json:
+        sys.stdout = sys.stderr
+
+    # Imported here so --help answers without loading pandas and requests
+    from weeding import WeedingProcessor, load_credentials
+
+    options = {key: value for key, value in vars(args).items()
+               if value is not None and key not in ("cutoff_year", "credentials", "json")}
+    if args.credentials:
+        try:
+            options["credentials"] = load_credentials(args.credentials)
+        except Exception as e:
+            print(f"Error loading credentials: {str(e)}")
+            return 2
+    if args.json:
+        options["progress"] = json_progress(events)
+
+    processor = WeedingProcessor(args.cutoff_year, **options)
+    return 0 if processor.run() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())